@@ -7,6 +7,13 @@ import os
 import sys
 import fcntl
 import atexit
+import json
+import math
+import hmac
+import hashlib
+import socket
+import struct
+from collections import OrderedDict
 from urllib.parse import quote
 from evdev import InputDevice, list_devices, ecodes, categorize
 from gpiozero import LED, DigitalOutputDevice
@@ -38,6 +45,21 @@ RFID_HINTS = ["swusb", "m-id", "uhf", "rfid", "scanner"]
 DEBUG_API = True
 LOG_FILENAME = "leituras_validacao.log"
 
+# Peers na LAN (compartilhamento de veredictos entre postos vizinhos)
+# Desligado por padrão. Quando ligado, um OK vindo da API é anunciado via UDP
+# multicast e os outros postos da mesma linha (mesmo prefixo em API_URL_BASE)
+# respondem localmente a mesma tag enquanto o anúncio estiver fresco.
+# Só veredictos OK são compartilhados: um NOK pode ser falha de rede/timeout.
+PEER_ENABLED       = False
+PEER_GROUP         = "239.255.60.41"
+PEER_PORT          = 50641
+PEER_IFACE_ADDR    = "0.0.0.0"  # IP local da interface da linha (ex.: eth0); 0.0.0.0 = rota padrão
+PEER_SECRET        = os.environ.get("SMARTSUB_PEER_SECRET", "")  # HMAC-SHA256, igual em todos os postos
+PEER_TTL_S         = 120.0   # Validade de um veredicto de peer
+PEER_MAX_ENTRIES   = 512     # Limite de tags na tabela (memória limitada)
+PEER_MAX_SKEW_S    = 5.0     # Tolerância de relógio entre postos
+PEER_MAX_DATAGRAM  = 512     # Datagramas maiores são descartados
+
 # Lock (instância única) — NÃO usa /tmp para evitar PermissionError
 LOCK_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".smartsub_validator.lock")
 
@@ -79,6 +101,173 @@ def ensure_single_instance():
         sys.exit(2)
     return fd
 
+# ==============================================================================
+# PEERS NA LAN
+# ==============================================================================
+
+def split_post_path(url: str):
+    """Separa API_URL_BASE em (linha, posto): '.../6100/4041/92' -> ('6100/4041', '92')."""
+    parts = url.rstrip("/").split("/")
+    return "/".join(parts[-3:-1]), parts[-1]
+
+class PeerVerdictTable:
+    """Tabela LRU de tags confirmadas por peers, com expiração por tempo."""
+
+    def __init__(self, ttl_s: float = PEER_TTL_S, max_entries: int = PEER_MAX_ENTRIES):
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # tag -> (expira_em monotonic, posto)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def put(self, tag: str, post: str, age_s: float = 0.0):
+        expires = time.monotonic() + self.ttl_s - max(age_s, 0.0)
+        old = self._entries.get(tag)
+        # Um anúncio mais antigo (ou repetido) nunca prolonga a validade
+        if old and old[0] >= expires:
+            return
+        self._entries[tag] = (expires, post)
+        self._entries.move_to_end(tag)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, tag: str):
+        """Retorna o posto que confirmou a tag, ou None se ausente/expirada."""
+        entry = self._entries.get(tag)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._entries[tag]
+            return None
+        self._entries.move_to_end(tag)
+        return entry[1]
+
+class PeerLink(asyncio.DatagramProtocol):
+    """
+    Anuncia e recebe veredictos OK via UDP multicast (TTL 1, só o segmento local).
+    Mensagem: JSON {"body": {...}, "sig": HMAC-SHA256(body canônico)}.
+    """
+
+    def __init__(self, secret: str, api_url: str = API_URL_BASE,
+                 group: str = PEER_GROUP, port: int = PEER_PORT,
+                 iface_addr: str = PEER_IFACE_ADDR,
+                 table: PeerVerdictTable = None):
+        self.key = secret.encode("utf-8")
+        self.line, self.post = split_post_path(api_url)
+        self.group = group
+        self.port = port
+        self.iface_addr = iface_addr
+        self.table = table if table is not None else PeerVerdictTable()
+        self.transport = None
+        self.tx_sock = None
+        self.stats = {"sent": 0, "received": 0, "rejected": 0, "hits": 0}
+
+    # --- Assinatura -----------------------------------------------------------
+
+    def _sign(self, body: dict) -> str:
+        raw = json.dumps(body, sort_keys=True, separators=(",", ":")).encode("utf-8")
+        return hmac.new(self.key, raw, hashlib.sha256).hexdigest()
+
+    def encode(self, tag: str) -> bytes:
+        body = {"v": 1, "line": self.line, "post": self.post, "tag": tag,
+                "ok": True, "ts": round(time.time(), 3)}
+        return json.dumps({"body": body, "sig": self._sign(body)},
+                          separators=(",", ":")).encode("utf-8")
+
+    def decode(self, data: bytes):
+        """Valida um datagrama; retorna (tag, posto, idade_s) ou None."""
+        if len(data) > PEER_MAX_DATAGRAM:
+            return None
+        try:
+            msg = json.loads(data.decode("utf-8"))
+            body, sig = msg["body"], msg["sig"]
+            if not isinstance(body, dict) or not isinstance(sig, str):
+                return None
+            if not hmac.compare_digest(self._sign(body), sig):
+                return None
+            if body.get("v") != 1 or body.get("ok") is not True:
+                return None
+            if body.get("line") != self.line or body.get("post") == self.post:
+                return None
+            tag = body.get("tag")
+            if not isinstance(tag, str) or not tag or sanitize_tag(tag) != tag:
+                return None
+            ts = body.get("ts")
+            # bool é subclasse de int; NaN/inf tornariam a entrada eterna
+            if not isinstance(ts, (int, float)) or isinstance(ts, bool) or not math.isfinite(ts):
+                return None
+            age = time.time() - ts
+        except (ValueError, KeyError, TypeError, UnicodeDecodeError):
+            return None
+        if age < -PEER_MAX_SKEW_S or age >= self.table.ttl_s:
+            return None
+        return tag, str(body["post"]), age
+
+    # --- Rede -----------------------------------------------------------------
+
+    async def start(self):
+        iface = socket.inet_aton(self.iface_addr)
+        rx = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        try:
+            rx.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if hasattr(socket, "SO_REUSEPORT"):
+                rx.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            rx.bind(("", self.port))
+            mreq = struct.pack("4s4s", socket.inet_aton(self.group), iface)
+            rx.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+            rx.setblocking(False)
+
+            self.tx_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+            self.tx_sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, iface)
+            self.tx_sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+            self.tx_sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+            self.tx_sock.setblocking(False)
+
+            loop = asyncio.get_running_loop()
+            await loop.create_datagram_endpoint(lambda: self, sock=rx)
+        except Exception:
+            # Sem transport ainda: close() não alcançaria o socket já ligado à porta
+            rx.close()
+            self.close()
+            raise
+        print(f">>> Peers LAN: {self.group}:{self.port} (linha {self.line}, posto {self.post})")
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.stats["received"] += 1
+        verdict = self.decode(data)
+        if verdict is None:
+            self.stats["rejected"] += 1
+            return
+        tag, post, age = verdict
+        self.table.put(tag, post, age)
+
+    def announce(self, tag: str):
+        if self.tx_sock is None:
+            return
+        try:
+            self.tx_sock.sendto(self.encode(tag), (self.group, self.port))
+            self.stats["sent"] += 1
+        except OSError as e:
+            print(f"Erro ao anunciar para peers: {e}")
+
+    def lookup(self, tag: str):
+        post = self.table.get(tag)
+        if post is not None:
+            self.stats["hits"] += 1
+        return post
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+            self.transport = None
+        if self.tx_sock is not None:
+            self.tx_sock.close()
+            self.tx_sock = None
+
 # ==============================================================================
 # CLASSE PRINCIPAL
 # ==============================================================================
@@ -104,7 +293,17 @@ class SmartSubValidator:
 
         self.log_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), LOG_FILENAME)
 
+        # Peers na LAN (opcional)
+        self.peers = None
+        if PEER_ENABLED:
+            if PEER_SECRET:
+                self.peers = PeerLink(PEER_SECRET)
+            else:
+                print("AVISO: PEER_ENABLED sem SMARTSUB_PEER_SECRET; peers desativados.")
+
     def shutdown(self):
+        if self.peers:
+            self.peers.close()
         # Libera GPIO corretamente
         for dev in (self.green, self.red, self.buzzer):
             try:
@@ -210,7 +409,15 @@ class SmartSubValidator:
             ts_str = time.strftime("%Y-%m-%d %H:%M:%S")
             print(f"\n[{ts_str}] Lendo: {tag}")
 
-            is_ok = await asyncio.to_thread(self.api_request, tag)
+            # Hit de peer NÃO faz o POST deste posto: o log local é o único registro
+            peer_post = self.peers.lookup(tag) if self.peers else None
+            if peer_post is not None:
+                print(f"--- PEER: {tag} confirmada pelo posto {peer_post} (API não consultada) ---")
+                is_ok = True
+            else:
+                is_ok = await asyncio.to_thread(self.api_request, tag)
+                if is_ok and self.peers:
+                    self.peers.announce(tag)
 
             async with self.io_lock:
                 if is_ok:
@@ -225,7 +432,8 @@ class SmartSubValidator:
 
             try:
                 with open(self.log_path, "a", encoding="utf-8") as f:
-                    f.write(f"{ts_str}\t{tag}\t{'OK' if is_ok else 'NOK'}\n")
+                    source = f"\tPEER:{peer_post}" if peer_post is not None else ""
+                    f.write(f"{ts_str}\t{tag}\t{'OK' if is_ok else 'NOK'}{source}\n")
             except Exception as e:
                 print(f"Erro ao salvar log: {e}")
 
@@ -316,6 +524,13 @@ class SmartSubValidator:
     async def run(self):
         print("--- INICIANDO SMARTSUB VALIDATOR ---")
         try:
+            if self.peers:
+                try:
+                    await self.peers.start()
+                except OSError as e:
+                    print(f"Erro ao iniciar peers LAN (seguindo sem): {e}")
+                    self.peers.close()
+                    self.peers = None
             await asyncio.gather(
                 self.task_monitor_idle(),
                 self.task_read_rfid()
@@ -0,0 +1,181 @@
+"""
+Testes do compartilhamento de veredictos entre postos (PeerLink).
+Roda sem hardware: evdev/gpiozero/requests ausentes são substituídos por
+módulos vazios só para permitir o import, e o GPIO é trocado por fakes.
+
+    cd SmartSub_V2 && python -m pytest -q test_peer_verdicts.py
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+import types
+
+import pytest
+
+for _name, _attrs in (
+    ("evdev", ("InputDevice", "list_devices", "ecodes", "categorize")),
+    ("gpiozero", ("LED", "DigitalOutputDevice")),
+    ("requests", ()),
+):
+    try:
+        __import__(_name)
+    except ImportError:
+        _mod = types.ModuleType(_name)
+        for _attr in _attrs:
+            setattr(_mod, _attr, None)
+        sys.modules[_name] = _mod
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import rfid_validate_gpio as v  # noqa: E402
+
+SECRET = "segredo-de-teste"
+LINE_URL = "http://localhost:9062/api/checkpoint-posto/6100/4041"
+TEST_PORT = 52000 + os.getpid() % 1000  # evita conversa cruzada entre execuções
+
+
+class FakePin:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def on(self):
+        pass
+
+    def off(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def make_validator(monkeypatch, tmp_path):
+    monkeypatch.setattr(v, "LED", FakePin)
+    monkeypatch.setattr(v, "DigitalOutputDevice", FakePin)
+    api_calls = []
+
+    def factory(post):
+        app = v.SmartSubValidator()
+        app.log_path = str(tmp_path / f"posto_{post}.log")
+        app.peers = v.PeerLink(SECRET, f"{LINE_URL}/{post}", port=TEST_PORT)
+
+        def fake_api_request(tag):
+            api_calls.append((post, tag))
+            return True
+
+        async def no_feedback():
+            pass
+
+        app.api_request = fake_api_request
+        app.feedback_ok = no_feedback
+        app.feedback_nok = no_feedback
+        return app
+
+    factory.api_calls = api_calls
+    return factory
+
+
+async def _wait_for(cond, timeout=1.0):
+    deadline = time.monotonic() + timeout
+    while not cond():
+        if time.monotonic() > deadline:
+            return False
+        await asyncio.sleep(0.005)
+    return True
+
+
+def test_peers_avoid_api_calls(make_validator):
+    posts = ["91", "92", "93"]
+    tags = [f"0009{i:04d}" for i in range(10)]
+
+    async def scenario():
+        apps = [make_validator(p) for p in posts]
+        for app in apps:
+            await app.peers.start()
+        try:
+            for tag in tags:
+                # O primeiro posto consulta a API; os vizinhos leem a mesma tag em seguida
+                await apps[0].handle_tag(tag)
+                for app in apps[1:]:
+                    assert await _wait_for(lambda: app.peers.table.get(tag) is not None)
+                    await app.handle_tag(tag)
+        finally:
+            for app in apps:
+                app.shutdown()
+        return apps
+
+    apps = asyncio.run(scenario())
+
+    reads = len(tags) * len(posts)
+    calls = len(make_validator.api_calls)
+    avoided = reads - calls
+    print(f"\nLeituras: {reads} | chamadas API: {calls} | evitadas: {avoided}")
+    assert calls == len(tags)
+    assert avoided == len(tags) * (len(posts) - 1)
+    assert all(post == "91" for post, _ in make_validator.api_calls)
+    assert apps[1].peers.stats["hits"] == len(tags)
+
+    # Hit de peer fica marcado no log local com o posto de origem
+    with open(apps[1].log_path, encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    assert len(lines) == len(tags)
+    assert all(line.endswith("\tOK\tPEER:91") for line in lines)
+    with open(apps[0].log_path, encoding="utf-8") as f:
+        assert all(line.endswith("\tOK") for line in f.read().splitlines())
+
+
+def test_wrong_key_is_rejected():
+    async def scenario():
+        good = v.PeerLink(SECRET, f"{LINE_URL}/91", port=TEST_PORT)
+        evil = v.PeerLink("outra-chave", f"{LINE_URL}/99", port=TEST_PORT)
+        await good.start()
+        await evil.start()
+        try:
+            evil.announce("FORJADA")
+            assert await _wait_for(lambda: good.stats["received"] >= 1)
+        finally:
+            good.close()
+            evil.close()
+        return good
+
+    good = asyncio.run(scenario())
+    assert good.stats["rejected"] == good.stats["received"]
+    assert good.table.get("FORJADA") is None
+    assert good.decode(v.PeerLink("outra-chave", f"{LINE_URL}/99").encode("X1")) is None
+
+
+@pytest.mark.parametrize("ts", [float("nan"), float("inf"), "0", True, None])
+def test_invalid_timestamp_is_rejected(ts):
+    link = v.PeerLink(SECRET, f"{LINE_URL}/91")
+    body = {"v": 1, "line": link.line, "post": "92", "tag": "X1", "ok": True, "ts": ts}
+    data = json.dumps({"body": body, "sig": link._sign(body)}).encode("utf-8")
+    assert link.decode(data) is None
+
+
+def test_table_entries_expire():
+    table = v.PeerVerdictTable(ttl_s=0.05, max_entries=8)
+    table.put("A1", "92")
+    assert table.get("A1") == "92"
+    time.sleep(0.08)
+    assert table.get("A1") is None
+    assert len(table) == 0
+
+
+def test_table_is_bounded():
+    table = v.PeerVerdictTable(ttl_s=60.0, max_entries=4)
+    for i in range(100):
+        table.put(f"T{i}", "92")
+        assert len(table) <= 4
+    assert [table.get(f"T{i}") for i in range(96, 100)] == ["92"] * 4
+    assert table.get("T0") is None
+
+
+def test_table_evicts_least_recently_used():
+    table = v.PeerVerdictTable(ttl_s=60.0, max_entries=4)
+    for i in range(4):
+        table.put(f"T{i}", "92")
+    table.get("T0")  # Hit renova a entrada; T1 passa a ser a mais antiga
+    table.put("T4", "92")
+    assert table.get("T0") == "92"
+    assert table.get("T1") is None